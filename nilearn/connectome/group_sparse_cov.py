@@ -11,15 +11,23 @@ import warnings
 
 import numpy as np
 import scipy.linalg
+import scipy.sparse.csgraph
 from joblib import Memory, Parallel, delayed
 from sklearn.base import BaseEstimator
-from sklearn.covariance import empirical_covariance
 from sklearn.model_selection import check_cv
-from sklearn.utils.extmath import fast_logdet
 
 from .._utils import CacheMixin, logger
 from .._utils.extmath import is_spd
 
+# Symmetric rank-k update, used by empirical_covariances. It computes only
+# the upper triangle of X.T X, and half of the products of a full dot.
+_syrk = scipy.linalg.get_blas_funcs("syrk", dtype=np.float64)
+
+# Up to this number of features, W_inv is updated for all subjects at once
+# (_update_submatrices). Above it, the in-place BLAS updates done one subject
+# at a time (_update_submatrix) are faster than NumPy broadcasting.
+_MAX_FEATURES_BATCHED_UPDATE = 50
+
 
 def compute_alpha_max(emp_covs, n_samples):
     """Compute the critical value of the regularization parameter.
@@ -57,60 +65,143 @@ def compute_alpha_max(emp_covs, n_samples):
     .. footbibliography::
 
     """
-    A = np.copy(emp_covs)
-    n_samples = np.asarray(n_samples).copy()
+    n_samples = np.array(n_samples, dtype=np.float64)
     n_samples /= n_samples.sum()
 
-    for k in range(emp_covs.shape[-1]):
-        # Set diagonal to zero
-        A[..., k].flat[:: A.shape[0] + 1] = 0
-        A[..., k] *= n_samples[k]
-
-    norms = np.sqrt((A**2).sum(axis=-1))
+    norms = _weighted_norms(np.moveaxis(emp_covs, -1, 0), n_samples)
+    # Set diagonal to zero
+    np.fill_diagonal(norms, 0)
 
     return np.max(norms), np.min(norms[norms > 0])
 
 
-def _update_submatrix(full, sub, sub_inv, p, h, v):
+def _weighted_norms(matrices, weights):
+    """Compute the norms of the vectors of coefficients across a stack \
+    of matrices, weighted by subject.
+
+    matrices has shape (n_subjects, n_features, n_features). The returned
+    array has shape (n_features, n_features), and contains
+    sqrt(sum_k (weights[k] * matrices[k, i, j]) ** 2).
+
+    """
+    return np.sqrt(np.einsum("k,kij,kij->ij", weights**2, matrices, matrices))
+
+
+def _symmetrize(matrices):
+    """Make a stack of square matrices symmetric, in-place.
+
+    matrices has shape (n_matrices, n_features, n_features). All matrices are
+    processed in a single pass, that NumPy buffers as needed.
+
+    """
+    np.add(matrices, matrices.swapaxes(1, 2), out=matrices)
+    matrices *= 0.5
+
+
+def _spd_inv(matrices):
+    """Invert a stack of symmetric positive definite matrices.
+
+    matrices has shape (n_matrices, n_features, n_features). Inverses are
+    computed from Cholesky decompositions (LAPACK potrf and potri), which
+    takes about half the operations of a LU-based inversion, and gives
+    exactly symmetric results. Matrices that turn out not to be positive
+    definite are inverted with scipy.linalg.inv.
+
+    """
+    potrf, potri = scipy.linalg.get_lapack_funcs(
+        ("potrf", "potri"), (matrices,)
+    )
+    inverses = np.empty_like(matrices)
+    for k, matrix in enumerate(matrices):
+        # Transpose (same matrix) to pass a Fortran-contiguous array.
+        cholesky, info = potrf(matrix.T, lower=False)
+        if info == 0:
+            inverse, info = potri(cholesky, lower=False, overwrite_c=True)
+        if info != 0:
+            inverses[k] = scipy.linalg.inv(matrix)
+        else:
+            # Only the upper triangle is computed by potri.
+            inverses[k] = inverse
+    # Copy upper triangles to lower triangles
+    lower = np.tril_indices(matrices.shape[1], -1)
+    inverses[:, lower[0], lower[1]] = inverses[:, lower[1], lower[0]]
+    return inverses
+
+
+def _update_submatrix(full, sub, sub_inv, p, v):
     """Update submatrix and its inverse.
 
     sub_inv is the inverse of the submatrix of "full" obtained by removing
-    the p-th row and column.
+    the p-th row and column. "full" must be symmetric: the new row and
+    column of "sub" are both read from its (contiguous) n-th row, in the
+    preallocated array v.
 
     sub_inv is modified in-place. After execution of this function, it contains
     the inverse of the submatrix of "full" obtained by removing the n+1-th row
-    and column.
+    and column. It is not symmetrized: see _symmetrize.
 
     This computation is based on the Sherman-Woodbury-Morrison identity.
+    The rank-one updates are performed in-place by BLAS, on the
+    Fortran-contiguous transpose of sub_inv (which must be C-contiguous).
+    Calling BLAS directly avoids allocating outer products, as well as NumPy
+    dispatch overhead. The routines matching the dtype of sub_inv are used.
 
     """
+    ger, gemv = scipy.linalg.get_blas_funcs(("ger", "gemv"), (sub_inv,))
     n = p - 1
-    v[: n + 1] = full[: n + 1, n]
-    v[n + 1 :] = full[n + 2 :, n]
-    h[: n + 1] = full[n, : n + 1]
-    h[n + 1 :] = full[n, n + 2 :]
+    v[: n + 1] = full[n, : n + 1]
+    v[n + 1 :] = full[n, n + 2 :]
+
+    sub_inv_t = sub_inv.T  # Fortran-contiguous view, updated by ger
 
     # change row: first usage of SWM identity
-    coln = sub_inv[:, n : n + 1]  # 2d array, useful for sub_inv below
-    V = h - sub[n, :]
-    coln = coln / (1.0 + np.dot(V, coln))
+    V = v - sub[n, :]
+    coln = sub_inv[:, n] / (1.0 + np.dot(V, sub_inv[:, n]))
     # The following line is equivalent to
     # sub_inv -= np.outer(coln, np.dot(V, sub_inv))
-    sub_inv -= np.dot(coln, np.dot(V, sub_inv)[np.newaxis, :])
-    sub[n, :] = h
+    ger(-1.0, gemv(1.0, sub_inv_t, V), coln, a=sub_inv_t, overwrite_a=True)
+    sub[n, :] = v
 
     # change column: second usage of SWM identity
-    rown = sub_inv[n : n + 1, :]  # 2d array, useful for sub_inv below
     U = v - sub[:, n]
-    rown = rown / (1.0 + np.dot(rown, U))
-    # The following line is equivalent to (but faster)
+    rown = sub_inv[n, :] / (1.0 + np.dot(sub_inv[n, :], U))
+    # The following line is equivalent to
     # sub_inv -= np.outer(np.dot(sub_inv, U), rown)
-    sub_inv -= np.dot(np.dot(sub_inv, U)[:, np.newaxis], rown)
-    sub[:, n] = v  # equivalent to sub[n, :] += U
+    ger(
+        -1.0,
+        rown,
+        gemv(1.0, sub_inv_t, U, trans=1),
+        a=sub_inv_t,
+        overwrite_a=True,
+    )
+    sub[:, n] = v  # equivalent to sub[:, n] += U
+
+
+def _update_submatrices(full, sub, sub_inv, p, v):
+    """Update stacks of submatrices and of their inverses.
+
+    This is the same as calling _update_submatrix on every matrix of the
+    stacks full, sub and sub_inv (subjects along the first axis), but
+    processes all subjects at once. v has shape (n_subjects, n_features - 1).
+
+    """
+    n = p - 1
+    v[:, : n + 1] = full[:, n, : n + 1]
+    v[:, n + 1 :] = full[:, n, n + 2 :]
+
+    # change row: first usage of SWM identity
+    V = v - sub[:, n, :]
+    coln = sub_inv[:, :, n]
+    coln = coln / (1.0 + np.einsum("kj,kj->k", V, coln))[:, np.newaxis]
+    sub_inv -= coln[:, :, np.newaxis] * np.matmul(V[:, np.newaxis, :], sub_inv)
+    sub[:, n, :] = v
 
-    # Make sub_inv symmetric (overcome some numerical limitations)
-    sub_inv += sub_inv.T.copy()
-    sub_inv /= 2.0
+    # change column: second usage of SWM identity
+    U = v - sub[:, :, n]
+    rown = sub_inv[:, n, :]
+    rown = rown / (1.0 + np.einsum("kj,kj->k", rown, U))[:, np.newaxis]
+    sub_inv -= np.matmul(sub_inv, U[:, :, np.newaxis]) * rown[:, np.newaxis, :]
+    sub[:, :, n] = v
 
 
 def _assert_submatrix(full, sub, n):
@@ -129,6 +220,209 @@ def _assert_submatrix(full, sub, n):
     np.testing.assert_almost_equal(true_sub, sub)
 
 
+def _newton_raphson(cc, q, alpha2, gamma=0.0):
+    """Find the value of gamma solving the one-dimensional \
+    problem of the coordinate descent.
+
+    gamma is the zero of alpha2 - sum(cc / (1 + gamma * q) ** 2), computed
+    with a Newton-Raphson loop loosely based on Scipy's, starting from
+    the given initial value of gamma.
+
+    Returns gamma, and 1 + gamma * q as computed in the last iteration.
+
+    """
+    # Tolerance does not seem to be important for numerical
+    # stability (tolerance of 1e-2 works) but has an effect on
+    # overall convergence rate (the tighter the better.)
+    two_ccq = 2.0 * cc * q
+    aq = np.empty_like(q)
+    w = np.empty_like(q)  # temp. array
+    for _ in itertools.repeat(None, 100):
+        # Function whose zero must be determined (fval) and
+        # its derivative (fder).
+        # Written inplace to avoid temporary arrays, sums are computed
+        # with dot products.
+        np.multiply(gamma, q, out=aq)
+        aq += 1.0
+        np.divide(1.0, aq, out=w)
+        w *= w  # 1 / aq ** 2
+        ccw = np.dot(cc, w)
+        w /= aq  # 1 / aq ** 3
+        fder = np.dot(two_ccq, w)
+
+        if fder == 0:
+            msg = "derivative was zero."
+            warnings.warn(msg, RuntimeWarning)
+            break
+        fval = -(alpha2 - ccw) / fder
+        gamma = fval + gamma
+        if abs(fval) < 1.5e-8:
+            break
+
+    if abs(fval) > 0.1:
+        warnings.warn(
+            "Newton-Raphson step did not converge.\n"
+            "This may indicate a badly conditioned "
+            "system."
+        )
+    return gamma, aq
+
+
+def _coordinate_descent(y, u, W_inv, emp_cov_pp, n_samples, alpha):
+    """Perform one pass of coordinate descent on y, for all subjects.
+
+    y is modified in-place. Variables are named following (mostly) the
+    Honorio-Samaras paper notations, the loop on k (subjects) being implicit.
+
+    This is the innermost loop of the optimization: it does not perform any
+    debugging check, those are done by the caller.
+
+    """
+    n_subjects, n_coords = y.shape
+    # The one-dimensional problems are solved in double precision, whatever
+    # the dtype of y.
+    c = np.empty((n_subjects,), dtype=np.float64)
+
+    # T(k) -> n_samples[k]
+    # v(k) -> emp_cov_pp[k]
+    # Used in the innermost loop. Computed here to save some computation.
+    alpha2 = alpha**2
+    tv = n_samples * emp_cov_pp
+    tu = n_samples[:, np.newaxis] * u
+
+    for m in range(n_coords):
+        # h_22(k) -> W_inv[k, m, m]
+        # h_12(k) -> W_inv[k, m, :] without its m-th entry
+        # y_1(k) -> y[k, :] without its m-th entry
+        # u_2(k) -> u[k, m]
+        # y[:, m] is overwritten below: setting it to zero beforehand removes
+        # the m-th term from the sums, avoiding copies of h_12 and y_1.
+        # W_inv is symmetric, its rows give stride-1 sums.
+        y[:, m] = 0
+        np.einsum("kj,kj->k", W_inv[:, m, :], y, out=c)
+        c *= tv
+        c += tu[:, m]
+        np.negative(c, out=c)
+        c2 = np.sqrt(np.dot(c, c))
+
+        # x -> y[:][m]
+        # x* = 0 if c2 <= alpha: nothing to do.
+        if c2 > alpha:
+            # q(k) -> T(k) * v(k) * h_22(k)
+            # \lambda -> gamma   (lambda is a Python keyword)
+            q = tv * W_inv[:, m, m]
+            # x* = \lambda* diag(1 + \lambda q)^{-1} c
+            if alpha > 0:
+                # The zero lies in [r / max(q), r / min(q)]. Starting
+                # from the lower bound, Newton-Raphson iterates increase
+                # monotonically to it (the function is convex).
+                r = c2 / alpha - 1.0
+                if n_subjects == 1:
+                    # Exact solution
+                    gamma = r / q[0]
+                    aq = 1.0 + gamma * q
+                else:
+                    gamma, aq = _newton_raphson(c * c, q, alpha2, r / q.max())
+            else:
+                gamma, aq = _newton_raphson(c * c, q, alpha2)
+
+            y[:, m] = (gamma * c) / aq  # x*
+
+
+def _update_precisions(omega, emp_covs, n_samples, alpha, debug):
+    """Perform one iteration of the optimization, for all features.
+
+    omega is modified in-place. omega and emp_covs are stacks of matrices of
+    shape (n_subjects, n_features, n_features), with the same dtype.
+
+    """
+    n_subjects, n_features, _ = omega.shape
+    dtype = omega.dtype
+
+    # Preallocate arrays
+    y = np.empty((n_subjects, n_features - 1), dtype=dtype)
+    u = np.empty((n_subjects, n_features - 1), dtype=dtype)
+
+    # Auxiliary array.
+    batched_update = n_features <= _MAX_FEATURES_BATCHED_UPDATE
+    if batched_update:
+        v = np.empty((n_subjects, n_features - 1), dtype=dtype)
+    else:
+        v = np.empty((n_features - 1,), dtype=dtype)
+
+    for p in range(n_features):
+        if p == 0:
+            # Initial state: remove first col/row
+            W = omega[:, 1:, 1:].copy()  # stack of W(k)
+            W_inv = _spd_inv(W)  # stack of W^-1(k)
+            if debug:
+                for k in range(n_subjects):
+                    np.testing.assert_almost_equal(
+                        np.dot(W_inv[k], W[k]),
+                        np.eye(W_inv[k].shape[0]),
+                        decimal=10,
+                    )
+                    _assert_submatrix(omega[k], W[k], p)
+                    assert is_spd(W_inv[k])
+        else:
+            # Update W and W_inv
+            if debug:
+                omega_orig = omega.copy()
+
+            if batched_update:
+                _update_submatrices(omega, W, W_inv, p, v)
+            else:
+                for k in range(n_subjects):
+                    _update_submatrix(omega[k], W[k], W_inv[k], p, v)
+            # Make W_inv symmetric (overcome some numerical limitations)
+            _symmetrize(W_inv)
+
+            if debug:
+                for k in range(n_subjects):
+                    _assert_submatrix(omega[k], W[k], p)
+                    assert is_spd(W_inv[k], decimal=14)
+                    np.testing.assert_almost_equal(
+                        np.dot(W[k], W_inv[k]),
+                        np.eye(W_inv[k].shape[0]),
+                        decimal=10,
+                    )
+                # Check that omega has not been modified.
+                np.testing.assert_almost_equal(omega_orig, omega)
+
+        # In the following lines, implicit loop on k (subjects)
+        # Extract y and u. omega and emp_covs are exactly symmetric: their
+        # p-th rows are read rather than their columns, with stride 1.
+        y[:, :p] = omega[:, p, :p]
+        y[:, p:] = omega[:, p, p + 1 :]
+
+        u[:, :p] = emp_covs[:, p, :p]
+        u[:, p:] = emp_covs[:, p, p + 1 :]
+
+        if debug:
+            # q in _coordinate_descent must be positive. By construction,
+            # gamma is then nonnegative.
+            assert np.all(n_samples * emp_covs[:, p, p] > 0)
+            assert np.all(np.diagonal(W_inv, axis1=1, axis2=2) > 0)
+
+        _coordinate_descent(y, u, W_inv, emp_covs[:, p, p], n_samples, alpha)
+
+        # Copy back y in omega: row, then column from the row in one
+        # assignment (omega[:, p, p] is overwritten below).
+        omega[:, p, :p] = y[:, :p]
+        omega[:, p, p + 1 :] = y[:, p:]
+        omega[:, :, p] = omega[:, p, :]
+
+        # Quadratic forms y(k) W_inv(k) y(k), for all subjects at once.
+        # (einsum with optimize=True spends more time finding the
+        # contraction order than in computations.)
+        yW = np.matmul(y[:, np.newaxis, :], W_inv)[:, 0, :]
+        omega[:, p, p] = 1.0 / emp_covs[:, p, p] + np.einsum("kj,kj->k", yW, y)
+
+        if debug:
+            for k in range(n_subjects):
+                assert is_spd(omega[k])
+
+
 def group_sparse_covariance(
     subjects,
     alpha,
@@ -254,51 +548,64 @@ def _group_sparse_covariance(
             f"You provided: {alpha}"
         )
 
-    n_subjects = emp_covs.shape[-1]
-    n_features = emp_covs[0].shape[0]
-    n_samples = np.asarray(n_samples)
+    n_features = emp_covs.shape[0]
+    n_samples = np.asarray(n_samples, dtype=np.float64)
     n_samples /= n_samples.sum()  # essential for numerical stability
 
+    # Computations are performed on stacks of matrices, with subjects along
+    # the first axis: every matrix is then a contiguous block of memory, and
+    # linear algebra routines can process all subjects in a single call.
+    # Probe functions and callers see the (n_features, n_features, n_subjects)
+    # layout, using views obtained with np.moveaxis.
+    # Precisions have the dtype of emp_covs: single precision halves the
+    # memory traffic of the optimization.
+    emp_covs = np.ascontiguousarray(np.moveaxis(emp_covs, -1, 0))
+    diag = np.arange(n_features)
+
     # Check diagonal normalization.
-    ones = np.ones(emp_covs.shape[0])
-    for k in range(n_subjects):
-        if (
-            abs(emp_covs[..., k].flat[:: emp_covs.shape[0] + 1] - ones) > 0.1
-        ).any():
-            warnings.warn(
-                "input signals do not all have unit variance. This "
-                "can lead to numerical instability."
-            )
-            break
+    if (abs(emp_covs[:, diag, diag] - 1.0) > 0.1).any():
+        warnings.warn(
+            "input signals do not all have unit variance. This "
+            "can lead to numerical instability."
+        )
 
     if precisions_init is None:
-        # Fortran order make omega[..., k] contiguous, which is often useful.
-        omega = np.ndarray(shape=emp_covs.shape, dtype=np.float64, order="F")
-        for k in range(n_subjects):
-            # Values on main diagonals are far from zero, because they
-            # are timeseries energy.
-            omega[..., k] = np.diag(1.0 / np.diag(emp_covs[..., k]))
+        omega = np.zeros(emp_covs.shape, dtype=emp_covs.dtype)
+        # Values on main diagonals are far from zero, because they
+        # are timeseries energy.
+        omega[:, diag, diag] = 1.0 / emp_covs[:, diag, diag]
     else:
-        omega = precisions_init.copy()
-
-    # Preallocate arrays
-    y = np.ndarray(shape=(n_subjects, n_features - 1), dtype=np.float64)
-    u = np.ndarray(shape=(n_subjects, n_features - 1), dtype=np.float64)
-    y_1 = np.ndarray(shape=(n_subjects, n_features - 2), dtype=np.float64)
-    h_12 = np.ndarray(shape=(n_subjects, n_features - 2), dtype=np.float64)
-    q = np.ndarray(shape=(n_subjects,), dtype=np.float64)
-    aq = np.ndarray(shape=(n_subjects,), dtype=np.float64)  # temp. array
-    c = np.ndarray(shape=(n_subjects,), dtype=np.float64)
-    W = np.ndarray(
-        shape=(omega.shape[0] - 1, omega.shape[1] - 1, omega.shape[2]),
-        dtype=np.float64,
-        order="F",
+        omega = np.moveaxis(precisions_init, -1, 0).astype(
+            emp_covs.dtype, order="C"
+        )
+        # The optimization relies on exact symmetry.
+        _symmetrize(omega)
+
+    # Screening: the solution is block-diagonal, with blocks given by the
+    # connected components of the graph linking features i and j when
+    # ||n_samples[k] * emp_covs[k, i, j]||_2 > alpha (otherwise the optimal
+    # coefficients are all zero). Blocks can then be optimized separately,
+    # and one-feature blocks are already at their optimal value.
+    norms = _weighted_norms(emp_covs, n_samples)
+    n_blocks, labels = scipy.sparse.csgraph.connected_components(
+        norms > alpha, directed=False
+    )
+    # Set all coefficients outside of blocks to their optimal value.
+    omega[:, labels[:, np.newaxis] != labels] = 0
+    blocks = []
+    for label in range(n_blocks):
+        block = np.flatnonzero(labels == label)
+        if block.size == 1:
+            omega[:, block, block] = 1.0 / emp_covs[:, block, block]
+        else:
+            blocks.append((block, emp_covs[:, block[:, np.newaxis], block]))
+    logger.log(
+        f"{len(blocks)} block(s) of features to optimize, "
+        f"{n_blocks - len(blocks)} isolated feature(s)",
+        verbose=verbose,
+        msg_level=2,
+        stack_level=2,
     )
-    W_inv = np.ndarray(shape=W.shape, dtype=np.float64, order="F")
-
-    # Auxiliary arrays.
-    v = np.ndarray((omega.shape[0] - 1,), dtype=np.float64)
-    h = np.ndarray((omega.shape[1] - 1,), dtype=np.float64)
 
     # Optional.
     tolerance_reached = False
@@ -308,16 +615,19 @@ def _group_sparse_covariance(
     if probe_function is not None:
         # iteration number -1 means called before iteration loop.
         probe_function(
-            emp_covs, n_samples, alpha, max_iter, tol, -1, omega, None
+            np.moveaxis(emp_covs, 0, -1),
+            n_samples,
+            alpha,
+            max_iter,
+            tol,
+            -1,
+            np.moveaxis(omega, 0, -1),
+            None,
         )
     probe_interrupted = False
 
     # Start optimization loop. Variables are named following (mostly) the
     # Honorio-Samaras paper notations.
-
-    # Used in the innermost loop. Computed here to save some computation.
-    alpha2 = alpha**2
-
     for n in range(max_iter):
         if max_norm is not None:
             suffix = f" variation (max norm): {max_norm:.3e} "
@@ -332,142 +642,22 @@ def _group_sparse_covariance(
             )
 
         omega_old[...] = omega
-        for p in range(n_features):
-            if p == 0:
-                # Initial state: remove first col/row
-                W = omega[1:, 1:, :].copy()  # stack of W(k)
-                W_inv = np.ndarray(shape=W.shape, dtype=np.float64)
-                for k in range(W.shape[2]):
-                    # stack of W^-1(k)
-                    W_inv[..., k] = scipy.linalg.inv(W[..., k])
-                    if debug:
-                        np.testing.assert_almost_equal(
-                            np.dot(W_inv[..., k], W[..., k]),
-                            np.eye(W_inv[..., k].shape[0]),
-                            decimal=10,
-                        )
-                        _assert_submatrix(omega[..., k], W[..., k], p)
-                        assert is_spd(W_inv[..., k])
-            else:
-                # Update W and W_inv
-                if debug:
-                    omega_orig = omega.copy()
-
-                for k in range(n_subjects):
-                    _update_submatrix(
-                        omega[..., k], W[..., k], W_inv[..., k], p, h, v
-                    )
-
-                    if debug:
-                        _assert_submatrix(omega[..., k], W[..., k], p)
-                        assert is_spd(W_inv[..., k], decimal=14)
-                        np.testing.assert_almost_equal(
-                            np.dot(W[..., k], W_inv[..., k]),
-                            np.eye(W_inv[..., k].shape[0]),
-                            decimal=10,
-                        )
-                if debug:
-                    # Check that omega has not been modified.
-                    np.testing.assert_almost_equal(omega_orig, omega)
-
-            # In the following lines, implicit loop on k (subjects)
-            # Extract y and u
-            y[:, :p] = omega[:p, p, :].T
-            y[:, p:] = omega[p + 1 :, p, :].T
-
-            u[:, :p] = emp_covs[:p, p, :].T
-            u[:, p:] = emp_covs[p + 1 :, p, :].T
-
-            for m in range(n_features - 1):
-                # Coordinate descent on y
-
-                # T(k) -> n_samples[k]
-                # v(k) -> emp_covs[p, p, k]
-                # h_22(k) -> W_inv[m, m, k]
-                # h_12(k) -> W_inv[:m, m, k],  W_inv[m+1:, m, k]
-                # y_1(k) -> y[k, :m], y[k, m+1:]
-                # u_2(k) -> u[k, m]
-                h_12[:, :m] = W_inv[:m, m, :].T
-                h_12[:, m:] = W_inv[m + 1 :, m, :].T
-                y_1[:, :m] = y[:, :m]
-                y_1[:, m:] = y[:, m + 1 :]
-
-                c[:] = -n_samples * (
-                    emp_covs[p, p, :] * (h_12 * y_1).sum(axis=1) + u[:, m]
-                )
-                c2 = np.sqrt(np.dot(c, c))
-
-                # x -> y[:][m]
-                if c2 <= alpha:
-                    y[:, m] = 0  # x* = 0
-                else:
-                    # q(k) -> T(k) * v(k) * h_22(k)
-                    # \lambda -> gamma   (lambda is a Python keyword)
-                    q[:] = n_samples * emp_covs[p, p, :] * W_inv[m, m, :]
-                    if debug:
-                        assert np.all(q > 0)
-                    # x* = \lambda* diag(1 + \lambda q)^{-1} c
-
-                    # Newton-Raphson loop. Loosely based on Scipy's.
-                    # Tolerance does not seem to be important for numerical
-                    # stability (tolerance of 1e-2 works) but has an effect on
-                    # overall convergence rate (the tighter the better.)
-
-                    gamma = 0.0  # initial value
-                    # Precompute some quantities
-                    cc = c * c
-                    two_ccq = 2.0 * cc * q
-                    for _ in itertools.repeat(None, 100):
-                        # Function whose zero must be determined (fval) and
-                        # its derivative (fder).
-                        # Written inplace to save some function calls.
-                        aq = 1.0 + gamma * q
-                        aq2 = aq * aq
-                        fder = (two_ccq / (aq2 * aq)).sum()
-
-                        if fder == 0:
-                            msg = "derivative was zero."
-                            warnings.warn(msg, RuntimeWarning)
-                            break
-                        fval = -(alpha2 - (cc / aq2).sum()) / fder
-                        gamma = fval + gamma
-                        if abs(fval) < 1.5e-8:
-                            break
-
-                    if abs(fval) > 0.1:
-                        warnings.warn(
-                            "Newton-Raphson step did not converge.\n"
-                            "This may indicate a badly conditioned "
-                            "system."
-                        )
-
-                    if debug:
-                        assert gamma >= 0.0, gamma
-                    y[:, m] = (gamma * c) / aq  # x*
-
-            # Copy back y in omega (column and row)
-            omega[:p, p, :] = y[:, :p].T
-            omega[p + 1 :, p, :] = y[:, p:].T
-            omega[p, :p, :] = y[:, :p].T
-            omega[p, p + 1 :, :] = y[:, p:].T
-
-            for k in range(n_subjects):
-                omega[p, p, k] = 1.0 / emp_covs[p, p, k] + np.dot(
-                    np.dot(y[k, :], W_inv[..., k]), y[k, :]
-                )
-
-                if debug:
-                    assert is_spd(omega[..., k])
+        for block, block_emp_covs in blocks:
+            block_omega = omega[:, block[:, np.newaxis], block]
+            _update_precisions(
+                block_omega, block_emp_covs, n_samples, alpha, debug=debug
+            )
+            omega[:, block[:, np.newaxis], block] = block_omega
 
         if probe_function is not None and probe_function(
-            emp_covs,
+            np.moveaxis(emp_covs, 0, -1),
             n_samples,
             alpha,
             max_iter,
             tol,
             n,
-            omega,
-            omega_old,
+            np.moveaxis(omega, 0, -1),
+            np.moveaxis(omega_old, 0, -1),
         ):
             probe_interrupted = True
             logger.log(
@@ -499,7 +689,7 @@ def _group_sparse_covariance(
             "to the requested tolerance level."
         )
 
-    return omega
+    return np.asfortranarray(np.moveaxis(omega, 0, -1))
 
 
 class GroupSparseCovariance(BaseEstimator, CacheMixin):
@@ -654,20 +844,46 @@ def empirical_covariances(subjects, assume_centered=False, standardize=False):
 
     # Enable to change dtype here because depending on user, conversion from
     # single precision to double will be required or not.
-    emp_covs = np.empty((n_features, n_features, n_subjects), order="F")
+    # Matrices are stored with subjects along the first axis, so that each
+    # of them is contiguous and _group_sparse_covariance does not need to
+    # copy them. The returned array is a view with subjects along the last
+    # axis.
+    emp_covs = np.empty((n_subjects, n_features, n_features))
     for k, s in enumerate(subjects):
+        s = np.asarray(s, dtype=np.float64)
         if standardize:
             s = s / s.std(axis=0)  # copy on purpose
-        M = empirical_covariance(s, assume_centered=assume_centered)
-
-        # Force matrix symmetry, for numerical stability
-        # of _group_sparse_covariance
-        emp_covs[..., k] = M + M.T
-    emp_covs /= 2
+        if not assume_centered:
+            s = s - s.mean(axis=0)
+        # s.T is Fortran-ordered: passing it avoids a copy.
+        cov = _syrk(1.0 / s.shape[0], s.T)
+        emp_covs[k] = cov
+        # Copy the upper triangle into the lower one. Matrices are then
+        # exactly symmetric, as required by _group_sparse_covariance.
+        emp_covs[k] += np.triu(cov, 1).T
 
     n_samples = np.asarray([s.shape[0] for s in subjects], dtype=np.float64)
 
-    return emp_covs, n_samples
+    return np.moveaxis(emp_covs, 0, -1), n_samples
+
+
+def _logdets(matrices):
+    """Compute the log-determinants of a stack of symmetric matrices.
+
+    matrices has shape (n_matrices, n_features, n_features). All matrices are
+    processed at once using Cholesky decompositions. As with
+    sklearn.utils.extmath.fast_logdet, -inf is returned for matrices with a
+    non-positive determinant.
+
+    """
+    try:
+        cholesky = np.linalg.cholesky(matrices)
+    except np.linalg.LinAlgError:
+        # At least one matrix is not positive definite.
+        signs, logdets = np.linalg.slogdet(matrices)
+        logdets[signs <= 0] = -np.inf
+        return logdets
+    return 2.0 * np.log(np.diagonal(cholesky, axis1=1, axis2=2)).sum(axis=1)
 
 
 def group_sparse_scores(
@@ -717,47 +933,45 @@ def group_sparse_scores(
     """
     n_features, _, n_subjects = emp_covs.shape
 
-    log_lik = 0
-    for k in range(n_subjects):
-        log_lik_k = -np.sum(emp_covs[..., k] * precisions[..., k])
-        log_lik_k += fast_logdet(precisions[..., k])
-        log_lik += n_samples[k] * log_lik_k
+    # Traces of products of symmetric matrices, without temporary arrays.
+    traces = np.einsum("ijk,ijk->k", emp_covs, precisions)
+    logdets = _logdets(np.moveaxis(precisions, -1, 0))
+    log_lik = np.dot(n_samples, logdets - traces)
 
-    l2 = np.sqrt((precisions**2).sum(axis=-1))
+    l2 = np.sqrt(np.einsum("ijk,ijk->ij", precisions, precisions))
     l12 = l2.sum() - np.diag(l2).sum()  # Do not count diagonal terms
     objective = alpha * l12 - log_lik
     ret = (log_lik, objective)
 
     # Compute duality gap if requested
     if duality_gap is True:
-        A = np.empty(precisions.shape, dtype=np.float64, order="F")
-        for k in range(n_subjects):
-            # TODO: can be computed more efficiently using W_inv. See
-            # Friedman, Jerome, Trevor Hastie, and Robert Tibshirani.
-            # 'Sparse Inverse Covariance Estimation with the Graphical Lasso'.
-            # Biostatistics 9, no. 3 (1 July 2008): 432-441.
-            precisions_inv = scipy.linalg.inv(precisions[..., k])
-            if debug:
-                assert is_spd(precisions_inv)
-
-            A[..., k] = n_samples[k] * (precisions_inv - emp_covs[..., k])
-
-            if debug:
-                np.testing.assert_almost_equal(A[..., k], A[..., k].T)
+        # Stacks of matrices, with subjects along the first axis.
+        emp_covs = np.moveaxis(emp_covs, -1, 0)
+        weights = np.asarray(n_samples)[:, np.newaxis, np.newaxis]
+        diag = np.arange(n_features)
+
+        # TODO: can be computed more efficiently using W_inv. See
+        # Friedman, Jerome, Trevor Hastie, and Robert Tibshirani.
+        # 'Sparse Inverse Covariance Estimation with the Graphical Lasso'.
+        # Biostatistics 9, no. 3 (1 July 2008): 432-441.
+        precisions_inv = _spd_inv(np.moveaxis(precisions, -1, 0))
+        A = weights * (precisions_inv - emp_covs)
+        if debug:
+            for k in range(n_subjects):
+                assert is_spd(precisions_inv[k])
+                np.testing.assert_almost_equal(A[k], A[k].T)
 
         # Project A on the set of feasible points
-        alpha_max = np.sqrt((A**2).sum(axis=-1))
+        alpha_max = _weighted_norms(A, np.ones(n_subjects))
         mask = alpha_max > alpha
-        for k in range(A.shape[-1]):
-            A[mask, k] *= alpha / alpha_max[mask]
-            # Set zeros on diagonals. Essential to get an always positive
-            # duality gap.
-            A[..., k].flat[:: A.shape[0] + 1] = 0
+        A[:, mask] *= alpha / alpha_max[mask]
+        # Set zeros on diagonals. Essential to get an always positive
+        # duality gap.
+        A[:, diag, diag] = 0
 
-        dual_obj = 0  # dual objective
-        for k in range(n_subjects):
-            B = emp_covs[..., k] + A[..., k] / n_samples[k]
-            dual_obj += n_samples[k] * (n_features + fast_logdet(B))
+        # dual objective
+        B = emp_covs + A / weights
+        dual_obj = np.dot(n_samples, n_features + _logdets(B))
 
         # The previous computation can lead to a non-feasible point, because
         # one of the Bs may not be positive definite.
@@ -765,19 +979,14 @@ def group_sparse_scores(
         # of B. The upper bound on the duality gap is not tight in the
         # following, but is smaller than infinity, which is better in any case.
         if not np.isfinite(dual_obj):
-            for k in range(n_subjects):
-                A[..., k] = -n_samples[k] * emp_covs[..., k]
-                A[..., k].flat[:: A.shape[0] + 1] = 0
-            alpha_max = np.sqrt((A**2).sum(axis=-1)).max()
+            A = -weights * emp_covs
+            A[:, diag, diag] = 0
+            alpha_max = _weighted_norms(A, np.ones(n_subjects)).max()
             # the second value (0.05 is arbitrary: positive in ]0,1[)
             gamma = min((alpha / alpha_max, 0.05))
-            dual_obj = 0
-            for k in range(n_subjects):
-                # add gamma on the diagonal
-                B = (1.0 - gamma) * emp_covs[..., k] + gamma * np.eye(
-                    emp_covs.shape[0]
-                )
-                dual_obj += n_samples[k] * (n_features + fast_logdet(B))
+            # add gamma on the diagonal
+            B = (1.0 - gamma) * emp_covs + gamma * np.eye(n_features)
+            dual_obj = np.dot(n_samples, n_features + _logdets(B))
 
         gap = objective - dual_obj
         ret = (*ret, gap)
@@ -922,6 +1131,55 @@ class EarlyStopProbe:
         self.last_log_lik = log_lik
 
 
+class ObjectiveChangeProbe:
+    """Callable probe for early stopping on the objective decrease.
+
+    Stop optimizing as soon as the relative decrease of the objective,
+    (previous - current) / max(abs(current), 1), goes below tol.
+    An instance of this class is supposed to be passed in the probe_function
+    argument of group_sparse_covariance().
+
+    Parameters
+    ----------
+    tol : float, default=1e-4
+        tolerance on the relative decrease of the objective.
+
+    verbose : int, default=0
+        verbosity level. Zero means "no message".
+
+    """
+
+    def __init__(self, tol=1e-4, verbose=0):
+        self.tol = tol
+        self.verbose = verbose
+
+    def __call__(  # noqa: D102
+        self,
+        emp_covs,
+        n_samples,
+        alpha,
+        max_iter,  # noqa: ARG002
+        tol,  # noqa: ARG002
+        iter_n,
+        omega,
+        prev_omega,  # noqa: ARG002
+    ):
+        _, objective = group_sparse_scores(omega, n_samples, emp_covs, alpha)
+        if iter_n > -1:
+            decrease = (self.last_objective - objective) / max(
+                abs(objective), 1.0
+            )
+            if decrease < self.tol:
+                logger.log(
+                    "Relative decrease of the objective is below "
+                    f"tolerance: {decrease:.3e}. "
+                    f"Stopping at iteration {iter_n}",
+                    verbose=self.verbose,
+                )
+                return True
+        self.last_objective = objective
+
+
 class GroupSparseCovarianceCV(BaseEstimator, CacheMixin):
     """Sparse inverse covariance w/ cross-validated choice of the parameter.
 
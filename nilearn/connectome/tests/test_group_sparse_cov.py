@@ -4,6 +4,12 @@ import pytest
 from nilearn._utils.data_gen import generate_group_sparse_gaussian_graphs
 from nilearn.connectome import GroupSparseCovariance, GroupSparseCovarianceCV
 from nilearn.connectome.group_sparse_cov import (
+    ObjectiveChangeProbe,
+    _group_sparse_covariance,
+    _spd_inv,
+    _update_submatrices,
+    _update_submatrix,
+    empirical_covariances,
     group_sparse_covariance,
     group_sparse_scores,
 )
@@ -83,6 +89,162 @@ def test_group_sparse_covariance_with_probe_function(rng):
     assert omega.shape == (10, 10, 5)
 
 
+def test_group_sparse_covariance_objective_change_probe(rng):
+    signals, _, _ = generate_group_sparse_gaussian_graphs(
+        density=0.1,
+        n_subjects=5,
+        n_features=10,
+        min_n_samples=100,
+        max_n_samples=151,
+        random_state=rng,
+    )
+
+    alpha = 0.1
+    probe = ObjectiveChangeProbe(tol=1e-4)
+    iterations = []
+
+    def probe_function(*args):
+        iterations.append(args[5])
+        return probe(*args)
+
+    emp_covs, omega = group_sparse_covariance(
+        signals, alpha, max_iter=100, tol=None, probe_function=probe_function
+    )
+
+    # Stopped before max_iter, once the objective stopped decreasing.
+    assert iterations[-1] < 99
+    n_samples = np.array([len(s) for s in signals], dtype=np.float64)
+    n_samples /= n_samples.sum()
+    _, objective = group_sparse_scores(omega, n_samples, emp_covs, alpha)
+    assert (probe.last_objective - objective) / max(abs(objective), 1) < 1e-4
+
+
+@pytest.mark.parametrize("assume_centered", [True, False])
+@pytest.mark.parametrize("standardize", [True, False])
+def test_empirical_covariances(rng, assume_centered, standardize):
+    subjects = [rng.standard_normal((n_samples, 6)) for n_samples in (20, 30)]
+
+    emp_covs, n_samples = empirical_covariances(
+        subjects, assume_centered=assume_centered, standardize=standardize
+    )
+
+    assert emp_covs.shape == (6, 6, 2)
+    np.testing.assert_array_equal(n_samples, [20, 30])
+    for k, s in enumerate(subjects):
+        if standardize:
+            s = s / s.std(axis=0)
+        if not assume_centered:
+            s = s - s.mean(axis=0)
+        np.testing.assert_almost_equal(emp_covs[..., k], s.T @ s / len(s))
+        np.testing.assert_array_equal(emp_covs[..., k], emp_covs[..., k].T)
+
+
+def test_spd_inv(rng):
+    X = rng.standard_normal((3, 5, 15))
+    matrices = X @ X.transpose(0, 2, 1)
+    # Not positive definite: must fall back to a generic inversion.
+    matrices[1] *= -1
+
+    inverses = _spd_inv(matrices)
+
+    np.testing.assert_almost_equal(inverses, np.linalg.inv(matrices))
+    np.testing.assert_array_equal(inverses, inverses.transpose(0, 2, 1))
+
+
+def test_update_submatrices(rng):
+    # The batched update must give the same result as the per-subject one.
+    n_subjects, n_features, p = 4, 8, 3
+    X = rng.standard_normal((n_subjects, n_features, 3 * n_features))
+    full = X @ X.transpose(0, 2, 1) / (3 * n_features)
+    # Submatrices obtained by removing the (p - 1)-th row and column.
+    sub = np.delete(np.delete(full, p - 1, axis=1), p - 1, axis=2)
+    sub_inv = np.linalg.inv(sub)
+
+    sub1, sub_inv1 = sub.copy(), sub_inv.copy()
+    v = np.empty(n_features - 1)
+    for k in range(n_subjects):
+        _update_submatrix(full[k], sub1[k], sub_inv1[k], p, v)
+
+    sub2, sub_inv2 = sub.copy(), sub_inv.copy()
+    v = np.empty((n_subjects, n_features - 1))
+    _update_submatrices(full, sub2, sub_inv2, p, v)
+
+    expected_sub = np.delete(np.delete(full, p, axis=1), p, axis=2)
+    np.testing.assert_almost_equal(sub1, expected_sub)
+    np.testing.assert_almost_equal(sub2, expected_sub)
+    np.testing.assert_almost_equal(sub_inv1, np.linalg.inv(expected_sub))
+    np.testing.assert_almost_equal(sub_inv2, sub_inv1)
+
+
+def test_group_sparse_covariance_block_diagonal(rng):
+    # Uncorrelated groups of features are optimized separately. The result
+    # must be the same as when estimating each group on its own.
+    signals1, _, _ = generate_group_sparse_gaussian_graphs(
+        density=0.1,
+        n_subjects=5,
+        n_features=10,
+        min_n_samples=100,
+        max_n_samples=151,
+        random_state=rng,
+    )
+    signals2, _, _ = generate_group_sparse_gaussian_graphs(
+        density=0.1,
+        n_subjects=5,
+        n_features=6,
+        min_n_samples=100,
+        max_n_samples=151,
+        random_state=rng,
+    )
+    n_samples = [min(len(s1), len(s2)) for s1, s2 in zip(signals1, signals2)]
+    signals1 = [s[:n] for s, n in zip(signals1, n_samples)]
+    signals2 = [s[:n] for s, n in zip(signals2, n_samples)]
+    signals = [np.hstack(s) for s in zip(signals1, signals2)]
+
+    alpha = 0.1
+
+    _, omega = group_sparse_covariance(signals, alpha, max_iter=5, tol=None)
+    _, omega1 = group_sparse_covariance(signals1, alpha, max_iter=5, tol=None)
+    _, omega2 = group_sparse_covariance(signals2, alpha, max_iter=5, tol=None)
+
+    assert np.all(omega[:10, 10:] == 0)
+    assert np.all(omega[10:, :10] == 0)
+    np.testing.assert_almost_equal(omega[:10, :10], omega1, decimal=10)
+    np.testing.assert_almost_equal(omega[10:, 10:], omega2, decimal=10)
+
+    # Above alpha_max, all features are isolated: precisions are diagonal.
+    emp_covs, omega = group_sparse_covariance(
+        signals, 10.0, max_iter=5, tol=None
+    )
+    for k in range(emp_covs.shape[-1]):
+        np.testing.assert_array_equal(
+            omega[..., k], np.diag(1.0 / np.diag(emp_covs[..., k]))
+        )
+
+
+@pytest.mark.parametrize("n_features", [10, 60])
+def test_group_sparse_covariance_float32(rng, n_features):
+    # 60 features: submatrices are updated one subject at a time.
+    signals, _, _ = generate_group_sparse_gaussian_graphs(
+        density=0.1,
+        n_subjects=3,
+        n_features=n_features,
+        min_n_samples=100,
+        max_n_samples=151,
+        random_state=rng,
+    )
+    emp_covs, n_samples = empirical_covariances(signals, standardize=True)
+
+    omega = _group_sparse_covariance(
+        emp_covs, n_samples, 0.1, max_iter=3, tol=None
+    )
+    omega32 = _group_sparse_covariance(
+        emp_covs.astype(np.float32), n_samples, 0.1, max_iter=3, tol=None
+    )
+
+    assert omega32.dtype == np.float32
+    np.testing.assert_allclose(omega32, omega, rtol=1e-4, atol=1e-5)
+
+
 def test_group_sparse_covariance_check_consistency_between_classes(rng):
     signals, _, _ = generate_group_sparse_gaussian_graphs(
         density=0.1,